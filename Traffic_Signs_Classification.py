@@ -15,10 +15,16 @@ import pandas as pd
 
 # Libraries used for plotting and data visualization
 import matplotlib.pyplot as plt
-import seaborn as sns
 
-# Using pickle package to open our data, not much use after that
+# Using pickle package to open our data, not much use after that. The os package lets us check which data files already exist
 import pickle
+import os
+
+# TensorFlow does the heavy number crunching for us, on the GPU if one is available
+import tensorflow as tf
+
+# Drawing the sample images takes a while and opens a window for each one, so they are only shown when the project is run with DEBUG_PLOTS=1
+DEBUG_PLOTS = os.environ.get('DEBUG_PLOTS', '0') == '1'
 
 
 """
@@ -29,28 +35,42 @@ the real world. The validation dataset ensures that we avoid overfitting by show
 the network validation data every epoch (or run) in a process called 
 cross-validation to ensure that the network is not focusing on the details of the
 training data. 
+
+Unpickling the data is slow because pickle rebuilds every Python object from 
+scratch, so the first run saves each dataset as plain NumPy .npy files next to the 
+pickle files. Every run after that maps the .npy files straight into memory 
+(mmap_mode = 'r'), which skips the unpickling entirely.
 """
-with open("./traffic-signs-data/train.p", mode = 'rb') as training_data:
-  train = pickle.load(training_data) # Use pickle's load method to load the defined data as the variable test
+def save_npy(path, array):
+  temporary_path = path + ".part"
+  with open(temporary_path, mode = 'wb') as temporary_file:
+    np.save(temporary_file, array) # Write the whole file under a temporary name first
+  os.replace(temporary_path, path) # Then rename it in one step, so a run that gets interrupted halfway never leaves a broken .npy file behind that later runs would try to load
 
-with open("./traffic-signs-data/valid.p", mode = 'rb') as validation_data:
-  valid = pickle.load(validation_data)
+def load_dataset(name):
+  features_path = "./traffic-signs-data/{}_features.npy".format(name)
+  labels_path = "./traffic-signs-data/{}_labels.npy".format(name)
 
-with open("./traffic-signs-data/test.p", mode = 'rb') as testing_data:
-  test = pickle.load(testing_data)
+  if not (os.path.exists(features_path) and os.path.exists(labels_path)): # Only convert the pickle file the first time we run the project
+    with open("./traffic-signs-data/{}.p".format(name), mode = 'rb') as pickled_data:
+      data = pickle.load(pickled_data) # Use pickle's load method to load the defined data as the variable data
+    save_npy(features_path, data['features']) # The images are already stored as compact uint8 values (0 to 255) so we save them as they are
+    save_npy(labels_path, data['labels'].astype(np.int16)) # There are only 43 classes, so a 16-bit integer is more than enough for each label
+
+  return np.load(features_path, mmap_mode = 'r'), np.load(labels_path).astype(np.int16, copy = False) # The labels are tiny, so they are loaded into memory in full. The .astype makes sure they are 16-bit integers even if the .npy files came from somewhere else, and costs nothing when they already are
 
 
 """
 Splitting the data into our individual training and testing set variables.
 """
 # Assigning the features of the training set as X_train and the dependent variable (labels) as y_train
-X_train, y_train = train['features'], train['labels']
+X_train, y_train = load_dataset('train')
 
 # Assigning the features of the validation set as X_validation and the dependent variable (labels) as y_validation
-X_validation, y_validation = valid['features'], valid['labels']
+X_validation, y_validation = load_dataset('valid')
 
 # Assigning the features of the testing set as X_test and the dependent variable (labels) as y_test
-X_test, y_test = test['features'], test['labels']
+X_test, y_test = load_dataset('test')
 
 # Checking the dimensions of the training set
 X_train.shape # Gives us an output of a four element tuple. The first number is the quantity of images, the second is the width of image in pixels, the third is the height of the image, and the last number the depth - in this case the 3 tells us that the images are colored since they are being multiplied for both Red, Green, and Blue
@@ -71,15 +91,20 @@ model.
 """
 i = 23 # The index of the image we want to look at, arbitrarily chose 23
 
-plt.imshow(X_train[i]) # Using matplotlib's .imshow method to show an image from the features training set at the index of 23
-y_train[i] # Also show us the corresponding label from the same index in the label's training set - the label tells us that the sign is a "End of No Passing"
-
-plt.imshow(X_validation[i]) # Verifying images for the validation dataset
+y_train[i] # Show us the label from the index in the label's training set - the label tells us that the sign is a "End of No Passing"
 y_validation[i]
-
-plt.imshwo(X_test[i]) # Verifying images for the testing dataset
 y_test[i]
 
+if DEBUG_PLOTS:
+  plt.imshow(X_train[i]) # Using matplotlib's .imshow method to show the image from the features training set at the same index of 23
+  plt.show()
+
+  plt.imshow(X_validation[i]) # Verifying images for the validation dataset
+  plt.show()
+
+  plt.imshow(X_test[i]) # Verifying images for the testing dataset
+  plt.show()
+
 
 """
 Preparing the data by shaving off things we don't need in the data. Such as 
@@ -92,32 +117,46 @@ We want to make it as hard as possible for the network to learn, which is why we
 use low-quality images, more restricted pixel range, and grayscale images. 
 """
 # Shuffling the dataset
-from sklearn.utils import shuffle # Importing the shuffle function from the sci-kit learn library to shuffle the dataset first
-X_train, y_train = shuffle(X_train, y_train) # Used the shuffle function to reassign the variables of X_train and y_train into a different order, however the labels still correspond to the correct images because the shuffle function reorders them the same way
+# We don't make shuffled copies of the images and labels here. The training pipeline further below reshuffles the whole training set every epoch while it feeds the network, which keeps every label with its image
 
 # Converting images to Grayscale
-X_train_gray = np.sum(X_train / 3, axis = 3, keepdims = True) # Use numpy to average the pixels to get the grayscale version of the image. We will simply add the pixel values from the three color channels (Red, Green, and Blue) and then divide them by 3. 
+def rgb_to_luma(images):
+  weights = np.array([77, 150, 29], dtype = np.uint16) # The luminance weights (ITU-R BT.601) for Red, Green, and Blue are 0.299, 0.587, and 0.114. Our eyes are more sensitive to green than to blue, so a plain average of the three channels makes some signs look washed out. Multiplying the weights by 256 turns them into whole numbers that add up to exactly 256
+  return ((images @ weights + 128) >> 8).astype(np.uint8)[..., np.newaxis] # The weighted sum of three uint8 values never goes above 65535, so it fits in a 16-bit integer. Adding 128 rounds to the nearest value and shifting right by 8 bits divides by 256. The [..., np.newaxis] adds the depth of 1 back to the end of the shape so the images are (32, 32, 1)
+
+X_train_gray = rgb_to_luma(X_train) # Use numpy to take a weighted sum of the color channels to get the grayscale version of the image. Everything is done with whole numbers so the grayscale images are still stored as compact uint8 values (1 byte per pixel)
 X_train_gray.shape # The depth of the features training set is no longer 3, its now 1. This means the images are now grayscale
-plt.imshow(X_train_gray[i].squeeze(), cmap = 'gray') # The network will now learn from this "grayscale" image which uses much less processing power because the image depth is reduced to 1
 
-X_validation_gray = np.sum(X_validation/3, axis = 3, keepdims = True)
-X_validation_gray.shape # Averaging the RGB values to reduce the depth from 3 to 1 for the feature's validation set
-plt.imshow(X_validation_gray[i].squeeze(), cmap = 'gray') # Grayscale sample image from the feature's validation set
+X_validation_gray = rgb_to_luma(X_validation)
+X_validation_gray.shape # Weighting the RGB values to reduce the depth from 3 to 1 for the feature's validation set
 
-X_test_gray = np.sum(X_test/3, axis = 3, keepdims = True)
+X_test_gray = rgb_to_luma(X_test)
 X_test_gray.shape 
-plt.imshow(X_test_gray[i].squeeze(), cmap = 'gray')
 
-# Restrict the pixel value scale for each dataset, aka normalization. Normalization is important because we want all our pixels in a similar range so the weight at one part of the image is not a lot more than the weight at another part of an image.
-X_train_gray_norm = (X_train_gray - 128) / 128 # There are many kinds of normalization methods. This one works by subtracting the image pixels by 128 because we want to center the data from its range of 0 to 255 (256 total, so half is 128). We then divide by 128 to put all the data between -1 and 1.
-# X_train_gray_norm ~ confirms that all the pixel values are between -1 and 1
-plt.imshow(X_train_gray_norm[i].squeeze(), cmap = 'gray') # The .squeeze() method gets rid of the 1 (last number) at the end of our tuple when we call the .shape method. This is because the 1 represented the depth of each image, but because our images are now grayscale we no longer need to include that. We are also specifying that we want our colormap, or cmap, to be in grayscale so we give it the 'gray' value.
+if DEBUG_PLOTS:
+  plt.imshow(X_train_gray[i].squeeze(), cmap = 'gray') # The network will now learn from this grayscale image which uses much less processing power because the image depth is reduced to 1
+  plt.show()
+
+  plt.imshow(X_validation_gray[i].squeeze(), cmap = 'gray') # Grayscale sample image from the feature's validation set
+  plt.show()
 
-X_validation_gray_norm = (X_validation_gray - 128) / 128
-plt.imshow(X_validation_gray_norm[i].squeeze(), cmap = 'gray')
+  plt.imshow(X_test_gray[i].squeeze(), cmap = 'gray')
+  plt.show()
 
-X_test_gray_norm = (X_test_gray - 128) / 128
-plt.imshow(X_test_gray_norm[i].squeeze(), cmap = 'gray')
+# Restrict the pixel value scale for each dataset, aka normalization. Normalization is important because we want all our pixels in a similar range so the weight at one part of the image is not a lot more than the weight at another part of an image. The network normalizes the images itself in its very first layer (see below), so the datasets stay as compact uint8 values, here we only look at our sample images.
+if DEBUG_PLOTS:
+  X_train_gray_norm = (X_train_gray[i] - 128.0) / 128 # There are many kinds of normalization methods. This one works by subtracting the image pixels by 128 because we want to center the data from its range of 0 to 255 (256 total, so half is 128). We then divide by 128 to put all the data between -1 and 1.
+  # X_train_gray_norm ~ confirms that all the pixel values are between -1 and 1
+  plt.imshow(X_train_gray_norm.squeeze(), cmap = 'gray') # The .squeeze() method gets rid of the 1 (last number) at the end of our tuple when we call the .shape method. This is because the 1 represented the depth of each image, but because our images are now grayscale we no longer need to include that. We are also specifying that we want our colormap, or cmap, to be in grayscale so we give it the 'gray' value.
+  plt.show()
+
+  X_validation_gray_norm = (X_validation_gray[i] - 128.0) / 128
+  plt.imshow(X_validation_gray_norm.squeeze(), cmap = 'gray')
+  plt.show()
+
+  X_test_gray_norm = (X_test_gray[i] - 128.0) / 128
+  plt.imshow(X_test_gray_norm.squeeze(), cmap = 'gray')
+  plt.show()
 
 
 """
@@ -133,13 +172,14 @@ which were numbers ranging from 0 to 1, while we have over 43 different traffic
 signs. 
 
 For our first step, we will take our input image (which is 32 x 32 x 1) and apply
-6 filters that are 5 x 5 with input depth of 3. The output of these filters will be 
-28 x 28 x 6 after the image has been processed through it. This is because there is 
-an equation the ouptut has to follow that applies when we run images to filters: 
+8 filters that are 6 x 6 with input depth of 1, moving 2px at a time. The output of 
+these filters will be 14 x 14 x 8 after the image has been processed through it. 
+This is because there is an equation the ouptut has to follow that applies when we 
+run images to filters: 
 
-                        Output = ((Input - Filter) + 1) / Stride
+                        Output = ((Input - Filter) / Stride) + 1
 the equation returns: 
-                        Output = ((32 - 5) + 1) / 1 = 28
+                        Output = ((32 - 6) / 2) + 1 = 14
 
 The stride is simply how much the kernel is shifted by each time when it passes over 
 the image. The kernel is essentially a feature map that scans the image by 
@@ -148,57 +188,66 @@ of 1 means that the kernel is moving 1px at a time which is slow. While a stride
 2 means its moving 2px each time. 
 
 The output depth is determined by the number of filters we apply, since we applied
-six filters the output of the image after the filters have been applied becomes
-28 x 28 x 6.
+eight filters the output of the image after the filters have been applied becomes
+14 x 14 x 8. The original LeNet-5 used six filters here, but we round up to eight 
+because the GPU's Tensor Cores work on chunks of 8 values at a time in half 
+precision (16-bit floats), so layer sizes that are multiples of 8 use them more 
+efficiently. The two extra filters are not free though: they add a third more 
+weights and math to this layer, and they make the input to the second convolution 
+deeper.
 
 The second step is to apply a ReLU function on the output. The rectified linear 
 unit, or ReLU, an activation function simply takes in input and converts all 
 negative numbers into 0's while maintaining all the positive numbers.
 
-Finally, a pooling layer (or subsampling layer) will be applied to simply shrink 
-the feature map by 2. This means the output depth will remain the same (the output
-from the filters is still maintained), however the size of the output will be 
-divided from 28 to 14. The result of the pooling layer is 14 x 14 x 6.
+The original LeNet-5 uses 5 x 5 filters with a stride of 1 (giving 28 x 28) and then
+a pooling layer (or subsampling layer) that shrinks the feature map by 2 by taking 
+the average of every 2 x 2 block (giving 14 x 14). Running those as two separate 
+layers means the large 28 x 28 output has to be written to memory just to be read 
+back in and averaged. A 6 x 6 filter moving 2px at a time looks at exactly the same
+patch of the image as a 5 x 5 filter followed by a 2 x 2 average, so we let the 
+convolution do the shrinking itself and skip the pooling layer entirely.
 """
 # Importing the Keras classes
 from keras.models import Sequential # We are going to use Keras which will sit on top of TensorFlow and help us build our network. From the keras.models module we will import the Sequential class which will allow us to build our network in a sequential fashion (building it one step at a time).
-from keras.layers import Conv2D, MaxPooling2D, AveragePooling2D, Dense, Flatten, Dropout # The Conv2D class will be used to perform our convolutions in the convolutional layers. The MaxPooling2D class is going to help us in the downsampling layers by selecting the largest pixel value in the pooling window. AveragePooling2D will also perform downsampling but it wil take the average of the pixels in the pooling window. Dense class helps build the dense layers. The Flatten class will help us flatten the matrix down to a vector of pixels. The Dropout class is implements a regularization technique that reduces overfitting by forcing some of the neurons to have an input of zero - which reduces dependency on any one feature.
+from keras.layers import Rescaling, Conv2D, MaxPooling2D, Dense, Flatten, Dropout # The Rescaling class multiplies and shifts every pixel value, which is exactly what our normalization does. The Conv2D class will be used to perform our convolutions in the convolutional layers. The MaxPooling2D class is going to help us in the downsampling layers by selecting the largest pixel value in the pooling window. Dense class helps build the dense layers. The Flatten class will help us flatten the matrix down to a vector of pixels. The Dropout class is implements a regularization technique that reduces overfitting by forcing some of the neurons to have an input of zero - which reduces dependency on any one feature.
 from keras.optimizers import Adam # The Adam class is optimization algorithm used to update the weights of the neural network. Adam maintains a running average of the gradients and uses them to update the model.
 from keras.callbacks import TensorBoard # We are basically using TensorFlow as the backend of the Keras API
+from keras import mixed_precision # The mixed_precision module lets us choose which kind of floats the layers do their math in
 
-# Applying the First Convolution
+# Training in Mixed Precision
+mixed_precision.set_global_policy('mixed_float16') # The layers will do their math in 16-bit floats (which run on the Tensor Cores of modern GPUs) while keeping their weights in 32-bit floats so the small updates during training are not rounded away
+
+# Normalizing the Images
 cnn_model = Sequential() # Create the Sequential class instance object
-cnn_model.add(Conv2D(filters = 6, kernel_size = (5,5), activation = 'relu', input_shape = (32, 32, 1))) # Use the Sequential class .add method to start building. The Conv2D is class is then called to build the first convolution layer, it takes 4 parameters. The first parameter is the number of filters which we know is 6. The kernel_size is the size of the filters which we know is 5 x 5 so we input the tuple (5,5). We specify the activation function as 'relu' to ensure ReLU is used. The final parameter is the input shape which will be the shape of the image so the tuple (32, 32, 1)
+cnn_model.add(Rescaling(scale = 1/128, offset = -1, input_shape = (32, 32, 1))) # Use the Sequential class .add method to start building. The Rescaling class is called to normalize the images as they come in. Dividing by 128 (scale = 1/128) and then subtracting 1 (offset = -1) is the same as subtracting 128 and then dividing by 128, which puts all the pixels between -1 and 1. It also turns the uint8 images into half precision floats, and because all of this happens on the GPU as each batch arrives, we never have to keep a normalized copy of the dataset around. The final parameter is the input shape which will be the shape of the image so the tuple (32, 32, 1)
 
-# Applying Pooling
-cnn_model.add(AveragePooling2D()) # Using the .add method from the Sequential class, call the AveragePooling2D class which will automatically apply average downsampling (average pixel value is chosen from pooling window) to our output. This means our output will go from (28, 28, 6) to (14, 14, 6). It will divide the image shape by 2 but will not affect the output depth.
+# Applying the First Convolution
+cnn_model.add(Conv2D(filters = 8, kernel_size = (6,6), strides = (2,2), activation = 'relu', data_format = 'channels_last')) # The Conv2D is class is then called to build the first convolution layer, it takes 5 parameters. The first parameter is the number of filters which we know is 8. The kernel_size is the size of the filters which we know is 6 x 6 so we input the tuple (6,6). The strides is how far the filters move each time, 2px in both directions so we input the tuple (2,2). This shrinks the output to (14, 14, 8) without a separate pooling layer. We specify the activation function as 'relu' to ensure ReLU is used. The final parameter is the data_format, which tells Keras that the depth comes last in our shapes (height, width, depth), which is the memory layout the GPU's fastest convolution algorithms are built for.
 
 
 """
 A second convolutional layer is applied which works with the output of the last
 layer. For our second step, we will simply repeat the process above but implementing 
 some slight changes. We will take the output from the previous convolutional layer, 
-which was 14 x 14 x 6 and then apply 16 filters. The filters will follow the same 
-equation from above:
+which was 14 x 14 x 8 and then apply 16 filters that are 6 x 6. The filters will 
+follow the same equation from above:
 
-                        Output = ((14-5) + 1) / 1 = 10
+                        Output = ((14 - 6) / 2) + 1 = 5
 
-The stride is 1px (kernel is shifting by 1px each time) and because we have applied 
-16 filters, the output of the filters will be 10 x 10 x 16.
+The stride is 2px (kernel is shifting by 2px each time) and because we have applied 
+16 filters, the output of the filters will be 5 x 5 x 16.
 
 Similar to the previous layer, we apply a ReLU funciton which will simply convert 
 all the negative values into 0's.
 
-A subsampling layer aka pooling layer is applied to reduce the size of the images 
-by 2. Meaning the images are shrunk down from 10 x 10 to 5 x 5, however the output 
-depth from the filters has not changed. This means that the output after the second 
-convolutional layer is 5 x 5 x 16.
+Just like before, the stride of 2 takes the place of the pooling layer that LeNet-5
+uses here. A 5 x 5 filter (giving 10 x 10) followed by a pooling layer that shrinks 
+the images by 2 would also end up at 5 x 5 x 16, which means that the output after 
+the second convolutional layer is the same 5 x 5 x 16.
 """
 # Applying the Second Convolution
-cnn_model.add(Conv2D(filters = 16, kernel_size = (5,5), activation = 'relu')) # Similar to the last filter except we no longer have to specify the input shape because the model already accepted the input from the last layer
-
-# Applying Pooling
-cnn_model.add(AveragePooling2D())
+cnn_model.add(Conv2D(filters = 16, kernel_size = (6,6), strides = (2,2), activation = 'relu', data_format = 'channels_last')) # Similar to the last filter except we no longer have to specify the input shape because the model already accepted the input from the last layer
 
 
 """
@@ -224,30 +273,32 @@ so that it can eventually make highly accurate predictions.
 
 In our case, the first dense layer will have 400 nodes which will each be assigned 
 a pixel from our 400 x 1 flattened vector. The nodes will then connect to a second 
-layer which only has 120 nodes (or neurons). The dense layer will then apply a ReLU 
+layer which only has 128 nodes (or neurons). LeNet-5 used 120 nodes here, we round
+up to the next multiple of 8 for the Tensor Cores. The dense layer will then apply a ReLU 
 activation function to the output before sending it off to the next layer.
 """
 # Building the first Dense layer
-cnn_model.add(Dense(units = 120, activation = 'relu')) # Use the .add method from the Sequential class, and then call the Dense class. This class takes the parameters units which is the number of nodes it needs to connect to for the next layer, and then the activation function which is ReLU
+cnn_model.add(Dense(units = 128, activation = 'relu')) # Use the .add method from the Sequential class, and then call the Dense class. This class takes the parameters units which is the number of nodes it needs to connect to for the next layer, and then the activation function which is ReLU
 
 
 """
 The second dense layer is similar to the first. It will take the input from the 
-120 nodes from the previous layer, manipulate the input with its own weights & 
+128 nodes from the previous layer, manipulate the input with its own weights & 
 biases, and then pass on the output to the next layer.
 
-The second dense layer will have 120 nodes to recieve the input from the previous 
-layer and then it's output will be passed on to another dense layer with 84 nodes. 
+The second dense layer will have 128 nodes to recieve the input from the previous 
+layer and then it's output will be passed on to another dense layer with 88 nodes 
+(84 in LeNet-5, rounded up to a multiple of 8). 
 The dense layer will then apply a ReLU activation function to the output before 
 sending it off to the next layer.
 """
 # Building the second Dense layer
-cnn_model.add(Dense(units = 84, activation = 'relu'))
+cnn_model.add(Dense(units = 88, activation = 'relu'))
 
 
 """
 The third and final dense layer will recieve input from the previous layer with its 
-84 nodes. This layer will be responsible for manipulating the input recieved and 
+88 nodes. This layer will be responsible for manipulating the input recieved and 
 sending it to the final output layer. The dense layer will then apply a ReLU 
 activation function to the output before sending it off to the output layer.
 
@@ -257,13 +308,14 @@ handwritten digits 0 to 9. However, we are trying to classify 43 different kinds
 signs so our output layer needs to have 43 nodes. One node for each class.
 """
 # Building the last Dense layer
-cnn_model.add(Dense(units = 43, activation = 'softmax')) # The activation function of the last layer can't use ReLU because the output needs to be categorical (ReLU just gives us numbers that aren't negatives). The softmax activation function takes in all the input and squashes it between 0 and 1, meaning the final values of all the numbers add up to 1. These numbers between 0 and 1 act as probability values (if you multiply by 100 you get the percentage) which is perfect for our project.
+cnn_model.add(Dense(units = 43, activation = 'softmax', dtype = 'float32')) # The activation function of the last layer can't use ReLU because the output needs to be categorical (ReLU just gives us numbers that aren't negatives). The softmax activation function takes in all the input and squashes it between 0 and 1, meaning the final values of all the numbers add up to 1. These numbers between 0 and 1 act as probability values (if you multiply by 100 you get the percentage) which is perfect for our project. We keep this last layer in 32-bit floats (dtype = 'float32') because tiny probabilities would get rounded to 0 in half precision and break the loss calculation.
 
 
 """
 To train the model, we will first have to compile it. We will use the .compile 
 method from the Sequential class. The method accepts the following classes which
-are used to compile and train the model effeciently: loss, optimizer, and metrics
+are used to compile and train the model effeciently: loss, optimizer, metrics, and 
+jit_compile
 
 The loss parameter allows us to specify what kind of loss function we want to use 
 to better train the model. The categorical cross entropy loss function measures the 
@@ -278,23 +330,55 @@ makes updates to the parameters (weights and biases).
 The metrics parameter lets us specify how we want to evaluate the model. The 
 accuracy metric allows us to evaluate the performance of the model based on the 
 number of correct predictions divided by the total predictions.
+
+The jit_compile parameter asks TensorFlow to compile each training step with XLA. 
+LeNet is a tiny network, so most of the time on a GPU is spent launching small 
+kernels rather than doing math. The convolutions and dense layers still run as their
+own kernels, but XLA merges the small element by element steps around them (adding 
+the biases, the ReLU activations, the casts between float types) into neighbouring 
+kernels, so there are fewer kernels to launch and fewer in-between results written 
+out to memory and read back in.
 """
 # Compile the model
-cnn_model.compile(loss = 'sparse_categorical_crossentropy', optimizer = Adam(learning_rate = 0.001), metrics = ['accuracy'])
+cnn_model.compile(loss = 'sparse_categorical_crossentropy', optimizer = Adam(learning_rate = 0.001), metrics = ['accuracy'], jit_compile = True)
+
+
+"""
+Before training, we wrap our data in a tf.data Dataset. Handing .fit a plain array
+means every batch is sliced and copied to the GPU only when the network asks for 
+it, so the GPU sits idle while it waits. A Dataset lets TensorFlow prepare the next
+batch while the GPU is still busy with the current one. The images stay as compact 
+uint8 grayscale images (1 byte per pixel) all the way to the GPU, where the first 
+layer of the network normalizes them.
+"""
+# Building the Input Pipelines
+y_train_labels = tf.constant(y_train, dtype = tf.int32) # Convert the labels into TensorFlow tensors once, in the integer type the loss function works with, so they are not converted again for every batch
+y_validation_labels = tf.constant(y_validation, dtype = tf.int32)
+y_test_labels = tf.constant(y_test, dtype = tf.int32)
+
+train_ds = (tf.data.Dataset.from_tensor_slices((X_train_gray, y_train_labels)) # Pair every training image with its label
+            .shuffle(len(y_train), seed = 0) # Reshuffle the images every epoch so the network can't learn their order. The buffer holds the whole training set (only 1 byte per pixel), so every epoch is a completely new order. Giving it a seed of 0 means we get the same sequence of orders every time we run the project, which makes our results easier to compare
+            .batch(500, drop_remainder = True) # Group the images into batches of 500, this is the number of images that will be fed into the network at once. The last 299 images that don't fill a whole batch are left out of that epoch. Because the whole training set is reshuffled every epoch, those are different random images each time. Every training batch has exactly the same shape, so XLA only has to compile the training step once (the validation and testing batches below keep every image, so their last smaller batch gets its own compiled version)
+            .prefetch(tf.data.AUTOTUNE)) # Get the next batch ready while the network trains on the current one. AUTOTUNE lets TensorFlow pick how many batches to keep ready
+
+validation_ds = (tf.data.Dataset.from_tensor_slices((X_validation_gray, y_validation_labels))
+                 .batch(500) # The validation data does not need to be shuffled because the network does not learn from it
+                 .prefetch(tf.data.AUTOTUNE))
+
+test_ds = (tf.data.Dataset.from_tensor_slices((X_test_gray, y_test_labels))
+           .batch(500)
+           .prefetch(tf.data.AUTOTUNE)) # The testing data keeps its original order so the predictions line up with y_test
 
 
 """
 Finally, to train the model we will use the .fit method from the Sequential class. 
 This class has a number of parameters that we will need to address for the network 
-to train effeciently, such as: features training dataset, dependent variable 
-training dataset, batch_size, nb_epoch, verbose, validation_data.
+to train effeciently, such as: training dataset, epochs, verbose, validation_data.
 """
-history = cnn_model.fit(X_train_gray_norm, # The first parameter of the .fit method is the features training dataset. Here we will just input the features training data which are the images that we prepared by shuffling, grayscaling, and normalizing. The images are stored in the variable X_train_gray_norm
-              y_train, # The second parameter is the dependent varible training dataset (what we want to predict). We can just input the dependent variable training data which are the labels that correspond to every image in the features training data. These labels are stored in the variable y_train
-              batch_size = 500, # The third parameter is the batch_size with just means the number of images that will be fed into the network at once.
-              epochs = 5, # The fourth parameter is the epochs which means the number of epochs or a single pass through the entire dataset. At the end of each epoch, the model's performance is evaluated and recorded. Another epoch starts and the optimizer aims to perform better each time using the evaluations.
-              verbose = 1, # The fifth parameter is verbose which just means how much information the program shows us during the training process. Setting the value to 1 will show us all the background information, and the value will 0 will show us nothing.
-              validation_data = (X_validation_gray_norm, y_validation)) # The sixth parameter is the validation_data. This is the dataset we will use to avoid overfitting by showing the network validation data every epoch so that the network is not focusing on the details of the training data. The validation images are stored in the variable X_validation_gray_norm and the validation labels are stored in the variable y_validation
+history = cnn_model.fit(train_ds, # The first parameter of the .fit method is the training dataset. Here we will just input the training pipeline we built above, which gives the network batches of the images that we prepared by shuffling and grayscaling together with the labels that correspond to every image (what we want to predict)
+              epochs = 5, # The second parameter is the epochs which means the number of epochs or a single pass through the entire dataset. At the end of each epoch, the model's performance is evaluated and recorded. Another epoch starts and the optimizer aims to perform better each time using the evaluations.
+              verbose = 1, # The third parameter is verbose which just means how much information the program shows us during the training process. Setting the value to 1 will show us all the background information, and the value will 0 will show us nothing.
+              validation_data = validation_ds) # The fourth parameter is the validation_data. This is the dataset we will use to avoid overfitting by showing the network validation data every epoch so that the network is not focusing on the details of the training data. The validation images and labels are stored in the validation_ds pipeline
 
 
 """
@@ -303,7 +387,7 @@ performs in the real world. This can be done by showing the model the testing
 dataset which it has not seen before.
 """
 # Testing the Model
-score = cnn_model.evaluate(X_test_gray_norm, y_test) # Using the .evaluate method from the Sequential class that allows us to evaluate the model on the testing sets. The features testing set or the testing images are stored in the variable X_test_gray_norm and the labels are stored in y_test.
+score = cnn_model.evaluate(test_ds) # Using the .evaluate method from the Sequential class that allows us to evaluate the model on the testing sets. The testing images and labels are stored in the test_ds pipeline.
 
 # Printing the test accuracy
 print("Test Accuracy: {}%".format(round(score[1] * 100, 2)))
@@ -401,37 +485,103 @@ plt.legend(['Training', 'Validation'])
 plt.show()
 
 
+"""
+Once the network is trained we no longer need the precision that training needs. 
+Quantization converts the weights and the values flowing through the network from 
+floats into 8-bit integers (int8), which are 4 times smaller than 32-bit floats and 
+can be multiplied much faster by modern processors. We use TensorFlow Lite to do 
+this. It needs a small representative sample of our data to measure the range of 
+values in every layer so it can map them onto the 256 values an int8 can hold.
+
+TensorFlow Lite can only quantize layers that run in 32-bit floats, but our network
+was built to do its math in 16-bit floats for training. So we first make a copy of 
+the network where every layer runs in 32-bit floats and give it the trained weights
+(the weights were kept in 32-bit floats all along, so nothing is lost).
+"""
+# Copying the Model into 32-bit Floats
+from keras.models import clone_model # The clone_model function builds a new model with the same layers as an existing one
+
+def float32_layer(layer):
+  return layer.__class__.from_config({**layer.get_config(), 'dtype': 'float32'}) # Rebuild the same layer from its settings, but with the float32 policy instead of mixed_float16
+
+float32_model = clone_model(cnn_model, clone_function = float32_layer) # Same layers in the same order, without the trained weights
+float32_model.set_weights(cnn_model.get_weights()) # Copy the trained weights over
+
+# Quantizing the Model
+@tf.function(input_signature = [tf.TensorSpec(shape = (None, 32, 32, 1), dtype = tf.float32)]) # Any number of 32 x 32 x 1 images
+def predict_classes(images):
+  return tf.argmax(float32_model(images, training = False), axis = 1) # Picking the class with the highest probability inside the model means we get back a single class number per image instead of all 43 probabilities. This function is only used to export the model, so the argmax runs inside the TensorFlow Lite interpreter on the CPU along with the rest of the quantized model
+
+rng = np.random.default_rng(0) # Create numpy's random number generator, with a seed of 0 so we pick the same images every run
+sample_indices = rng.choice(len(y_train), size = 200, replace = False) # 200 random images from the training set are plenty to measure the ranges
+
+def representative_dataset():
+  for image in X_train_gray[sample_indices]:
+    yield [image[np.newaxis].astype(np.float32)] # TensorFlow Lite expects one batch of one image at a time, as 32-bit floats. The model normalizes the image itself
+
+converter = tf.lite.TFLiteConverter.from_concrete_functions([predict_classes.get_concrete_function()], float32_model) # Create the converter from the 32-bit copy of our trained model, with the argmax included at the end
+converter.optimizations = [tf.lite.Optimize.DEFAULT] # Ask the converter to quantize the model
+converter.representative_dataset = representative_dataset # Give it our sample images so it can quantize the values flowing through the network and not just the weights
+converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8, tf.lite.OpsSet.TFLITE_BUILTINS] # Prefer the int8 version of every operation, any operation that has no int8 version falls back to 32-bit floats instead of stopping the conversion
+tflite_model = converter.convert()
+
+interpreter = tf.lite.Interpreter(model_content = tflite_model) # The interpreter runs the quantized model
+input_details = interpreter.get_input_details()[0]
+output_details = interpreter.get_output_details()[0]
+interpreter.resize_tensor_input(input_details['index'], X_test_gray.shape) # Feed the whole testing set as one batch
+interpreter.allocate_tensors()
+
+
 """
 Creating a confusion matrix, which is a table that contains cases where the network
 guessed correctly and incorrectly.
 """
 # Extracting the Predicted Classes
-predicted_x = cnn_model.predict(X_test_gray_norm) # The .predict method of the Sequential class allows us to extract the predicted values and store them in predicted_x
-classes_x = np.argmax(predicted_x, axis = 1) # The predicted_x stores the probability distribution of each image, so we use the .argmax to get the highest proabability the network thinks the label should be. The .argmax method from the numpy class will return the index of the maximum value in the array. The axis class is just specifying the dimensions of the array (ours in a 1D array).
+interpreter.set_tensor(input_details['index'], X_test_gray.astype(np.float32)) # Hand the grayscale testing images to the quantized model
+interpreter.invoke() # Run the quantized model on the testing images
+classes_x = interpreter.get_tensor(output_details['index']) # Extract the predicted classes and store them in classes_x. The model already used tf.argmax to pick the highest proabability the network thinks the label should be for each image, so there is nothing left to do on our side
 
 y_true = y_test # Just creating a copy of the testing data labels and storing them in y_true
 
+# Printing the quantized test accuracy
+print("Quantized (int8) Test Accuracy: {}%".format(round(np.mean(classes_x == y_true) * 100, 2))) # The confusion matrix and the sample images below come from the quantized model, so we compare its accuracy with the Test Accuracy printed earlier to see how much the quantization cost us
+
 # Building the Confusion Matrix
-from sklearn.metrics import confusion_matrix # Importing the confusion_matrix function from sci-kit learn
+num_classes = 43 # One row and one column for each type of sign
+
+cm = np.bincount(y_true.astype(np.int32) * num_classes + classes_x.astype(np.int32), minlength = num_classes * num_classes).reshape(num_classes, num_classes) # Every (true label, predicted label) pair gets its own number, true * 43 + predicted, so counting how often each number shows up with np.bincount counts every cell of the confusion matrix in one go. Reshaping the 1849 counts into a 43 x 43 table puts the true labels on the rows and the predicted labels on the columns
 
-cm = confusion_matrix(y_true, classes_x) # Initiate the confusion matrix with the function confusion_matrix and give the correct labels and the predicted labels as parameters
+fig, ax = plt.subplots(figsize = (25, 25)) # Configure the size of the figure to be larger so we can see the individual labels and evaluate our data
+mesh = ax.pcolormesh(cm, cmap = 'Blues') # Use matplotlib's .pcolormesh method to produce a heatmap of the confusion matrix. The heatmap shows the true classes on the y-axis and the predicted classes on the x-axis, so every dark square off the diagonal is a group of samples the network misclassified.
+ax.invert_yaxis() # Put class 0 at the top left like a table, instead of the bottom left like a graph
+fig.colorbar(mesh) # The colorbar tells us how many samples each shade of blue stands for
 
-plt.figure(figsize = (25, 25)) # Configure the size of the figure to be larger so we can see the individual labels and evaluate our data
-sns.heatmap(cm, annot = True) # Use the .heatmap method from Seaborn to produce a heatmap of the confusion matrix. The heatmap shows the classes on the y-axis and the individual numbers on the x-axis are the number of samples it misclassified.
+for (true_class, predicted_class), count in np.ndenumerate(cm):
+  if count and true_class != predicted_class: # Only write the number of samples on the misclassified squares, most of the 1849 squares are empty and the diagonal is already easy to read from the colors
+    ax.text(predicted_class + 0.5, true_class + 0.5, int(count), ha = 'center', va = 'center', fontsize = 6) # Each square spans one unit, so adding 0.5 puts the number in its center
 
 
 """
 Plotting a sample of 25 images so we can see the predicted class and the true class
-label side by side. We can do this by using subplots to display all the plots in
-one figure.
+label side by side. Instead of giving every image its own subplot (which means 25 
+separate plots to lay out and draw), we stitch the 25 images together into a single 
+5 x 5 tiled image and draw it once, then write each label on top of its tile.
 """
 length = 5
 width = 5
+size = X_test.shape[1] # Every image is 32 x 32 pixels
+
+tiled = (X_test[:length * width] # Take the first 25 testing images, which is (25, 32, 32, 3)
+         .reshape(length, width, size, size, 3) # Arrange them into 5 rows of 5 images, (5, 5, 32, 32, 3)
+         .transpose(0, 2, 1, 3, 4) # Swap the axes so the pixel rows of every image in a row of the grid sit next to each other, (5, 32, 5, 32, 3)
+         .reshape(length * size, width * size, 3)) # Merge everything into one 160 x 160 color image
+
+plt.figure(figsize = (25, 25))
+plt.imshow(tiled)
+
+rows, columns = np.divmod(np.arange(length * width), width) # Work out the row and column of all 25 tiles at once. The row of the i-th tile is i // width and the column is i % width
 
-fig, axes = plt.subplots(length, width, figsize = (25, 25))
-axes = axes.ravel()
+for row, column, predicted, true in zip(rows, columns, classes_x, y_true): # zip stops after the 25 tiles, pairing each one with its predicted and true label
+  plt.text(column * size + size / 2, row * size + 1, 'Predictions = {}, True = {}'.format(predicted, true), ha = 'center', va = 'top', color = 'white', backgroundcolor = 'black') # Write the labels at the top center of each tile
 
-for i in np.arange(0, length * width):
-  axes[i].imshow(X_test[i])
-  axes[i].set_title('Predictions = {}, True = {}'.format(classes_x[i], y_true[i]))
-  axes[i].axis('off')
\ No newline at end of file
+plt.axis('off')
\ No newline at end of file